@@ -1,12 +1,51 @@
 #!/usr/bin/env python3
 
-import argparse
-import subprocess
-import json
+import functools
 import sys
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterable, List, NamedTuple, Optional, Tuple
 
+from maas_common import build_parser, get_machines, load_maas_profile, machine_name
 
+# Minimum size of the SSDs required on every machine
+ONE_TB = 1_000_000_000_000
+
+# Status markers used in the per-machine details
+CHECK_MARK, CROSS_MARK = "✅", "❌"
+YES, NO = f"{CHECK_MARK} YES", f"{CROSS_MARK} NO"
+
+# Category for each (boot disk is 1TB+ SSD, has an additional 1TB+ SSD,
+# has a non-boot SSD under 1TB) combination
+MACHINE_CATEGORIES = {
+    (True, True, True): "no_change_needed",
+    (True, True, False): "no_change_needed",
+    (False, True, True): "need_boot_disk_replacement",
+    (False, True, False): "need_boot_disk_replacement",
+    (True, False, True): "need_second_disk_replacement",
+    (True, False, False): "need_second_disk_addition",
+    (False, False, True): "need_both_boot_and_second_disk",
+    (False, False, False): "need_both_boot_and_second_disk",
+}
+
+
+class DiskInfo(NamedTuple):
+    """Boot disk of a machine"""
+
+    id: Optional[int]
+    name: Optional[str]
+    size: int
+    is_ssd: bool
+    is_1tb_ssd: bool
+
+
+class BlockSummary(NamedTuple):
+    """Block devices of a machine, with counts relative to the boot disk"""
+
+    additional_1tb_ssds: int
+    has_non_boot_ssd_under_1tb: bool
+    devices: List[Tuple[str, int, str]]
+
+
+@functools.lru_cache(maxsize=256)
 def format_size(size_bytes: int) -> str:
     """Convert bytes to TiB and TB format"""
     tib = size_bytes / (1024**4)
@@ -14,206 +53,179 @@ def format_size(size_bytes: int) -> str:
     return f"{tib:.2f} TiB ({tb:.2f} TB)"
 
 
-def analyze_boot_disk(machine: Dict[str, Any]) -> Dict[str, Any]:
+def analyze_boot_disk(machine: Dict[str, Any]) -> DiskInfo:
     """Analyze boot disk and return disk info and status"""
     boot_disk = machine.get("boot_disk")
     if boot_disk is None:
-        return {
-            "id": None,
-            "size": 0,
-            "is_ssd": False,
-            "is_1tb_ssd": False,
-            "info": "No boot disk information available",
-        }
+        return DiskInfo(id=None, name=None, size=0, is_ssd=False, is_1tb_ssd=False)
 
     boot_disk_id = boot_disk.get("id")
     boot_disk_size = boot_disk.get("size", 0)
     boot_disk_is_ssd = "ssd" in boot_disk.get("tags", [])
-    boot_disk_1tb_ssd = boot_disk_is_ssd and boot_disk_size >= 1_000_000_000_000
-
-    disk_type = "ssd" if boot_disk_is_ssd else "not ssd"
-    size_info = format_size(boot_disk_size)
-    info = f"{boot_disk.get('name', 'unknown')} - {size_info} ({disk_type})"
-
-    return {
-        "id": boot_disk_id,
-        "size": boot_disk_size,
-        "is_ssd": boot_disk_is_ssd,
-        "is_1tb_ssd": boot_disk_1tb_ssd,
-        "info": info,
-    }
+    boot_disk_1tb_ssd = boot_disk_is_ssd and boot_disk_size >= ONE_TB
+
+    return DiskInfo(
+        id=boot_disk_id,
+        name=boot_disk.get("name", "unknown"),
+        size=boot_disk_size,
+        is_ssd=boot_disk_is_ssd,
+        is_1tb_ssd=boot_disk_1tb_ssd,
+    )
 
 
 def analyze_block_devices(
     machine: Dict[str, Any], boot_disk_id: Optional[int]
-) -> Dict[str, Any]:
+) -> BlockSummary:
     """Analyze block devices and return counts and device info"""
     if "blockdevice_set" not in machine:
-        return {
-            "additional_1tb_ssds": 0,
-            "has_non_boot_ssd_under_1tb": False,
-            "device_info": [],
-        }
+        return BlockSummary(
+            additional_1tb_ssds=0, has_non_boot_ssd_under_1tb=False, devices=[]
+        )
 
     additional_1tb_ssds = 0
     has_non_boot_ssd_under_1tb = False
-    device_info = []
+    devices = []
 
     for device in machine["blockdevice_set"]:
         device_id = device.get("id")
         device_size = device.get("size", 0)
-        device_is_ssd = "ssd" in device.get("tags", [])
+        tags = device.get("tags", [])
+        device_is_ssd = "ssd" in tags
         device_type = (
-            "ssd"
-            if device_is_ssd
-            else "rotary" if "rotary" in device.get("tags", []) else "unknown"
+            "ssd" if device_is_ssd else "rotary" if "rotary" in tags else "unknown"
         )
 
-        size_info = format_size(device_size)
-        info = f"{device.get('name', 'unnamed')}: {size_info} ({device_type})"
-        device_info.append(info)
+        # Formatting is left to format_machine_details, which may not run
+        devices.append((device.get("name", "unnamed"), device_size, device_type))
 
         # Count additional 1TB+ SSDs (not the boot disk)
-        if device_id != boot_disk_id:
-            if device_is_ssd and device_size >= 1_000_000_000_000:
+        if device_is_ssd and device_id != boot_disk_id:
+            if device_size >= ONE_TB:
                 additional_1tb_ssds += 1
-            elif device_is_ssd and device_size < 1_000_000_000_000:
+            else:
                 has_non_boot_ssd_under_1tb = True
 
-    return {
-        "additional_1tb_ssds": additional_1tb_ssds,
-        "has_non_boot_ssd_under_1tb": has_non_boot_ssd_under_1tb,
-        "device_info": device_info,
-    }
+    return BlockSummary(
+        additional_1tb_ssds=additional_1tb_ssds,
+        has_non_boot_ssd_under_1tb=has_non_boot_ssd_under_1tb,
+        devices=devices,
+    )
 
 
 def categorize_machine(
-    boot_disk_info: Dict[str, Any], block_device_info: Dict[str, Any]
+    boot_disk_info: DiskInfo, block_device_info: BlockSummary
 ) -> str:
     """Categorize what changes are needed for a machine"""
-    boot_disk_1tb_ssd = boot_disk_info["is_1tb_ssd"]
-    additional_1tb_ssds = block_device_info["additional_1tb_ssds"]
-    has_non_boot_ssd_under_1tb = block_device_info["has_non_boot_ssd_under_1tb"]
-
-    has_required_config = boot_disk_1tb_ssd and additional_1tb_ssds >= 1
-
-    if has_required_config:
-        return "no_change_needed"
-    elif not boot_disk_1tb_ssd and additional_1tb_ssds >= 1:
-        return "need_boot_disk_replacement"
-    elif boot_disk_1tb_ssd and additional_1tb_ssds == 0:
-        if has_non_boot_ssd_under_1tb:
-            return "need_second_disk_replacement"
-        else:
-            return "need_second_disk_addition"
-    elif not boot_disk_1tb_ssd and additional_1tb_ssds == 0:
-        return "need_both_boot_and_second_disk"
-
-
-def print_machine_details(
-    machine_name: str, boot_disk_info: Dict[str, Any], block_device_info: Dict[str, Any]
-) -> None:
-    """Print detailed information for a single machine"""
-    print(f"\nMachine: {machine_name}")
-    print(f"Boot disk: {boot_disk_info['info']}")
-
-    device_info = block_device_info["device_info"]
-    print(f"Block devices ({len(device_info)}):")
-    for info in device_info:
-        print(f"  - {info}")
-
-    additional_1tb_ssds = block_device_info["additional_1tb_ssds"]
-    has_required_config = boot_disk_info["is_1tb_ssd"] and additional_1tb_ssds >= 1
-
-    print("\nRequirements check:")
-    print(f"  Boot disk is 1TB+ SSD: {'✅' if boot_disk_info['is_1tb_ssd'] else '❌'}")
-    print(f"  Additional 1TB+ SSDs: {additional_1tb_ssds} (need ≥1)")
-    print(
-        f"  Machine meets requirements: {'✅ YES' if has_required_config else '❌ NO'}"
+    key = (
+        boot_disk_info.is_1tb_ssd,
+        block_device_info.additional_1tb_ssds >= 1,
+        block_device_info.has_non_boot_ssd_under_1tb,
     )
-    print("-" * 60)
+    return MACHINE_CATEGORIES[key]
+
+
+def format_machine_details(
+    machine_name: str, boot_disk_info: DiskInfo, block_device_info: BlockSummary
+) -> str:
+    """Render detailed information for a single machine"""
+    lines = [f"\nMachine: {machine_name}"]
+    if boot_disk_info.name is None:
+        lines.append("Boot disk: No boot disk information available")
+    else:
+        disk_type = "ssd" if boot_disk_info.is_ssd else "not ssd"
+        size_info = format_size(boot_disk_info.size)
+        lines.append(f"Boot disk: {boot_disk_info.name} - {size_info} ({disk_type})")
 
+    devices = block_device_info.devices
+    lines.append(f"Block devices ({len(devices)}):")
+    for name, size, device_type in devices:
+        lines.append(f"  - {name}: {format_size(size)} ({device_type})")
 
-def print_summary(categories: Dict[str, List[str]]) -> None:
-    """Print the summary of changes needed"""
-    print("\n" + "=" * 60)
-    print("SUMMARY - Changes needed to meet requirements:")
-    print("=" * 60)
+    additional_1tb_ssds = block_device_info.additional_1tb_ssds
+    has_required_config = boot_disk_info.is_1tb_ssd and additional_1tb_ssds >= 1
+
+    lines.append("\nRequirements check:")
+    boot_disk_mark = CHECK_MARK if boot_disk_info.is_1tb_ssd else CROSS_MARK
+    lines.append(f"  Boot disk is 1TB+ SSD: {boot_disk_mark}")
+    lines.append(f"  Additional 1TB+ SSDs: {additional_1tb_ssds} (need ≥1)")
+    lines.append(f"  Machine meets requirements: {YES if has_required_config else NO}")
+    lines.append("-" * 60)
+
+    return "\n".join(lines) + "\n"
+
+
+def format_machine_list(machines: List[str]) -> str:
+    """Render a bulleted list of machine names"""
+    return "\n".join(f"  - {machine}" for machine in machines)
+
+
+def format_summary(categories: Dict[str, List[str]]) -> str:
+    """Render the summary of changes needed"""
+    lines = ["\n" + "=" * 60]
+    lines.append("SUMMARY - Changes needed to meet requirements:")
+    lines.append("=" * 60)
 
     if categories["no_change_needed"]:
-        print(f"\nNO CHANGES NEEDED ({len(categories['no_change_needed'])} machines):")
-        for machine in categories["no_change_needed"]:
-            print(f"  - {machine}")
+        lines.append(
+            f"\nNO CHANGES NEEDED ({len(categories['no_change_needed'])} machines):"
+        )
+        lines.append(format_machine_list(categories["no_change_needed"]))
 
     if categories["need_boot_disk_replacement"]:
-        print(
+        lines.append(
             f"\nREPLACE BOOT DISK with 1TB+ SSD ({len(categories['need_boot_disk_replacement'])} machines):"
         )
-        for machine in categories["need_boot_disk_replacement"]:
-            print(f"  - {machine}")
+        lines.append(format_machine_list(categories["need_boot_disk_replacement"]))
 
     if categories["need_second_disk_replacement"]:
-        print(
+        lines.append(
             f"\nREPLACE SECOND DISK with 1TB+ SSD ({len(categories['need_second_disk_replacement'])} machines):"
         )
-        for machine in categories["need_second_disk_replacement"]:
-            print(f"  - {machine}")
+        lines.append(format_machine_list(categories["need_second_disk_replacement"]))
 
     if categories["need_second_disk_addition"]:
-        print(
+        lines.append(
             f"\nADD SECOND 1TB+ SSD ({len(categories['need_second_disk_addition'])} machines):"
         )
-        for machine in categories["need_second_disk_addition"]:
-            print(f"  - {machine}")
+        lines.append(format_machine_list(categories["need_second_disk_addition"]))
 
     if categories["need_both_boot_and_second_disk"]:
-        print(
+        lines.append(
             f"\nREPLACE BOOT DISK + ADD/REPLACE SECOND DISK ({len(categories['need_both_boot_and_second_disk'])} machines):"
         )
-        for machine in categories["need_both_boot_and_second_disk"]:
-            print(f"  - {machine}")
+        lines.append(format_machine_list(categories["need_both_boot_and_second_disk"]))
 
     total_machines = sum(len(machines) for machines in categories.values())
-    print(f"\nTotal machines: {total_machines}")
-    print(f"Machines meeting requirements: {len(categories['no_change_needed'])}")
+    lines.append(f"\nTotal machines: {total_machines}")
+    lines.append(
+        f"Machines meeting requirements: {len(categories['no_change_needed'])}"
+    )
 
+    return "\n".join(lines) + "\n"
 
-def get_maas_machines(
-    profile: str, tag: Optional[str] = None, hostname: Optional[str] = None
-) -> List[Dict[str, Any]]:
-    """Query MAAS for machines and return parsed JSON"""
-    cmd = ["maas", profile, "machines", "read"]
 
-    if tag:
-        cmd.append(f"tags={tag}")
+def process_machine(
+    machine: Dict[str, Any], summary_only: bool = False
+) -> Tuple[str, str, str]:
+    """Analyze a single machine and return its name, category and details"""
+    name = machine_name(machine)
 
-    if hostname:
-        cmd.append(f"hostname={hostname}")
+    # Analyze machine components
+    boot_disk_info = analyze_boot_disk(machine)
+    block_device_info = analyze_block_devices(machine, boot_disk_info.id)
 
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return json.loads(result.stdout)
-    except subprocess.CalledProcessError as e:
-        print(f"Error running maas command: {e}", file=sys.stderr)
-        sys.exit(1)
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON output: {e}", file=sys.stderr)
-        sys.exit(1)
+    details = ""
+    if not summary_only:
+        details = format_machine_details(name, boot_disk_info, block_device_info)
 
+    # Categorize machine
+    category = categorize_machine(boot_disk_info, block_device_info)
 
-def main() -> None:
-    parser = argparse.ArgumentParser(
-        description="Query MAAS machines and count results"
-    )
-    parser.add_argument("profile", help="MAAS profile name (required)")
-    parser.add_argument("--tag", help="Filter by tag (optional)")
-    parser.add_argument("--hostname", help="Filter by hostname (optional)")
-
-    args = parser.parse_args()
+    return name, category, details
 
-    machines = get_maas_machines(args.profile, args.tag, args.hostname)
-    print(f"Number of machines returned: {len(machines)}")
 
+def run(machines: Iterable[Dict[str, Any]], summary_only: bool = False) -> None:
+    """Analyze machines and print the disk replacement report"""
     # Initialize categories
     categories = {
         "no_change_needed": [],
@@ -223,25 +235,26 @@ def main() -> None:
         "need_both_boot_and_second_disk": [],
     }
 
-    # Process each machine
-    for machine in machines:
-        machine_name = machine.get(
-            "hostname", machine.get("fqdn", machine.get("system_id", "unknown"))
-        )
+    results = [process_machine(machine, summary_only) for machine in machines]
 
-        # Analyze machine components
-        boot_disk_info = analyze_boot_disk(machine)
-        block_device_info = analyze_block_devices(machine, boot_disk_info["id"])
+    # Collect machine details in MAAS order and categorize machines
+    output = [f"Number of machines returned: {len(results)}\n"]
+    for name, category, details in results:
+        output.append(details)
+        categories[category].append(name)
 
-        # Print machine details
-        print_machine_details(machine_name, boot_disk_info, block_device_info)
+    output.append(format_summary(categories))
 
-        # Categorize machine
-        category = categorize_machine(boot_disk_info, block_device_info)
-        categories[category].append(machine_name)
+    # Write the whole report at once instead of line by line
+    sys.stdout.writelines(output)
+
+
+def main() -> None:
+    parser = build_parser("Query MAAS machines and count results")
+    args = parser.parse_args()
 
-    # Print summary
-    print_summary(categories)
+    profile = load_maas_profile(args.profile)
+    run(get_machines(profile, args.tag, args.hostname), args.summary_only)
 
 
 if __name__ == "__main__":
@@ -1,12 +1,35 @@
 #!/usr/bin/env python3
 
-import argparse
-import subprocess
-import json
+import functools
 import sys
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterable, List, NamedTuple, Optional, Tuple
 
+from maas_common import build_parser, get_machines, load_maas_profile, machine_name
 
+# Status markers used in the report
+CHECK_MARK, CROSS_MARK = "✅", "❌"
+YES, NO = f"{CHECK_MARK} YES", f"{CROSS_MARK} NO"
+
+
+class InterfaceInfo(NamedTuple):
+    """Physical network interface of a machine"""
+
+    name: str
+    enabled: bool
+    interface_speed: Optional[int]
+    link_speed: Optional[int]
+    is_connected: bool
+
+
+class InterfaceSummary(NamedTuple):
+    """Network interfaces of a machine and whether it has enough connected"""
+
+    interfaces: List[InterfaceInfo]
+    connected_count: int
+    meets_requirement: bool
+
+
+@functools.lru_cache(maxsize=256)
 def format_speed(speed: Optional[int]) -> str:
     """Convert speed from Mbps to human readable format"""
     if speed is None:
@@ -16,10 +39,14 @@ def format_speed(speed: Optional[int]) -> str:
     return f"{speed} Mbps"
 
 
-def analyze_interfaces(machine: Dict[str, Any]) -> Dict[str, Any]:
+def analyze_interfaces(
+    machine: Dict[str, Any], summary_only: bool = False
+) -> InterfaceSummary:
     """Analyze network interfaces and return interface info and connection status"""
     if "interface_set" not in machine:
-        return {"interfaces": [], "connected_count": 0, "meets_requirement": False}
+        return InterfaceSummary(
+            interfaces=[], connected_count=0, meets_requirement=False
+        )
 
     interfaces = []
     connected_count = 0
@@ -37,135 +64,139 @@ def analyze_interfaces(machine: Dict[str, Any]) -> Dict[str, Any]:
         if is_connected:
             connected_count += 1
 
-        interface_info = {
-            "name": interface_name,
-            "enabled": interface.get("enabled", False),
-            "interface_speed": interface.get("interface_speed"),
-            "link_speed": link_speed,
-            "interface_speed_formatted": format_speed(interface.get("interface_speed")),
-            "link_speed_formatted": format_speed(link_speed),
-            "is_connected": is_connected,
-        }
+        # Only the requirement matters for the summary, so stop once it is met
+        if summary_only:
+            if connected_count >= 3:
+                break
+            continue
+
+        interface_info = InterfaceInfo(
+            name=interface_name,
+            enabled=interface.get("enabled", False),
+            interface_speed=interface.get("interface_speed"),
+            link_speed=link_speed,
+            is_connected=is_connected,
+        )
         interfaces.append(interface_info)
 
     meets_requirement = connected_count >= 3
 
-    return {
-        "interfaces": interfaces,
-        "connected_count": connected_count,
-        "meets_requirement": meets_requirement,
-    }
+    return InterfaceSummary(
+        interfaces=interfaces,
+        connected_count=connected_count,
+        meets_requirement=meets_requirement,
+    )
 
 
-def print_machine_details(machine_name: str, interface_data: Dict[str, Any]) -> None:
-    """Print detailed information for a single machine"""
-    interfaces = interface_data["interfaces"]
-    connected_count = interface_data["connected_count"]
-    meets_requirement = interface_data["meets_requirement"]
+def format_machine_details(machine_name: str, interface_data: InterfaceSummary) -> str:
+    """Render detailed information for a single machine"""
+    interfaces = interface_data.interfaces
+    connected_count = interface_data.connected_count
+    meets_requirement = interface_data.meets_requirement
 
-    status_icon = "✅" if meets_requirement else "❌"
-    print(f"\nMachine: {machine_name} {status_icon}")
-    print(f"Network interfaces ({len(interfaces)}):")
+    status_icon = CHECK_MARK if meets_requirement else CROSS_MARK
+    lines = [f"\nMachine: {machine_name} {status_icon}"]
+    lines.append(f"Network interfaces ({len(interfaces)}):")
 
     if not interfaces:
-        print("  No interface information available")
+        lines.append("  No interface information available")
     else:
         for interface in interfaces:
-            status = "enabled" if interface["enabled"] else "disabled"
+            status = "enabled" if interface.enabled else "disabled"
             connection_status = (
-                "connected" if interface["is_connected"] else "disconnected"
+                "connected" if interface.is_connected else "disconnected"
             )
-            print(f"  - {interface['name']}: {status}, {connection_status}")
-            print(f"    Interface speed: {interface['interface_speed_formatted']}")
-            print(f"    Link speed: {interface['link_speed_formatted']}")
+            lines.append(f"  - {interface.name}: {status}, {connection_status}")
+            lines.append(
+                f"    Interface speed: {format_speed(interface.interface_speed)}"
+            )
+            lines.append(f"    Link speed: {format_speed(interface.link_speed)}")
 
-    print(f"\nConnected NICs: {connected_count} (need ≥3)")
-    print(f"Meets requirement: {'✅ YES' if meets_requirement else '❌ NO'}")
-    print("-" * 60)
+    lines.append(f"\nConnected NICs: {connected_count} (need ≥3)")
+    lines.append(f"Meets requirement: {YES if meets_requirement else NO}")
+    lines.append("-" * 60)
 
+    return "\n".join(lines) + "\n"
 
-def get_maas_machines(
-    profile: str, tag: Optional[str] = None, hostname: Optional[str] = None
-) -> List[Dict[str, Any]]:
-    """Query MAAS for machines and return parsed JSON"""
-    cmd = ["maas", profile, "machines", "read"]
 
-    if tag:
-        cmd.append(f"tags={tag}")
+def process_machine(
+    machine: Dict[str, Any], summary_only: bool = False
+) -> Tuple[str, bool, str]:
+    """Analyze a single machine and return its name, requirement status and details"""
+    name = machine_name(machine)
 
-    if hostname:
-        cmd.append(f"hostname={hostname}")
+    # Analyze machine interfaces
+    interface_data = analyze_interfaces(machine, summary_only)
 
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return json.loads(result.stdout)
-    except subprocess.CalledProcessError as e:
-        print(f"Error running maas command: {e}", file=sys.stderr)
-        sys.exit(1)
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON output: {e}", file=sys.stderr)
-        sys.exit(1)
+    details = ""
+    if not summary_only:
+        details = format_machine_details(name, interface_data)
 
+    return name, interface_data.meets_requirement, details
 
-def print_summary(
-    machines_meeting: List[str], machines_not_meeting: List[str], total_machines: int
-) -> None:
-    """Print the summary of machines meeting and not meeting requirements"""
-    print("\n" + "=" * 60)
-    print("SUMMARY - Network Interface Requirements:")
-    print("=" * 60)
 
-    print(f"\nTotal machines processed: {total_machines}")
-    print(f"Machines meeting requirements (≥3 connected NICs): {len(machines_meeting)}")
-    print(f"Machines not meeting requirements: {len(machines_not_meeting)}")
+def format_machine_list(machines: List[str]) -> str:
+    """Render a bulleted list of machine names"""
+    return "\n".join(f"  - {machine}" for machine in machines)
 
-    if machines_meeting:
-        print(f"\n✅ MACHINES MEETING REQUIREMENTS ({len(machines_meeting)}):")
-        for machine in machines_meeting:
-            print(f"  - {machine}")
 
-    if machines_not_meeting:
-        print(f"\n❌ MACHINES NOT MEETING REQUIREMENTS ({len(machines_not_meeting)}):")
-        for machine in machines_not_meeting:
-            print(f"  - {machine}")
+def format_summary(
+    machines_meeting: List[str], machines_not_meeting: List[str], total_machines: int
+) -> str:
+    """Render the summary of machines meeting and not meeting requirements"""
+    lines = ["\n" + "=" * 60]
+    lines.append("SUMMARY - Network Interface Requirements:")
+    lines.append("=" * 60)
+
+    lines.append(f"\nTotal machines processed: {total_machines}")
+    lines.append(
+        f"Machines meeting requirements (≥3 connected NICs): {len(machines_meeting)}"
+    )
+    lines.append(f"Machines not meeting requirements: {len(machines_not_meeting)}")
 
+    if machines_meeting:
+        lines.append(
+            f"\n{CHECK_MARK} MACHINES MEETING REQUIREMENTS ({len(machines_meeting)}):"
+        )
+        lines.append(format_machine_list(machines_meeting))
 
-def main() -> None:
-    parser = argparse.ArgumentParser(
-        description="Query MAAS machines and show network interface information"
-    )
-    parser.add_argument("profile", help="MAAS profile name (required)")
-    parser.add_argument("--tag", help="Filter by tag (optional)")
-    parser.add_argument("--hostname", help="Filter by hostname (optional)")
+    if machines_not_meeting:
+        lines.append(
+            f"\n{CROSS_MARK} MACHINES NOT MEETING REQUIREMENTS ({len(machines_not_meeting)}):"
+        )
+        lines.append(format_machine_list(machines_not_meeting))
 
-    args = parser.parse_args()
+    return "\n".join(lines) + "\n"
 
-    machines = get_maas_machines(args.profile, args.tag, args.hostname)
-    print(f"Number of machines returned: {len(machines)}")
 
+def run(machines: Iterable[Dict[str, Any]], summary_only: bool = False) -> None:
+    """Analyze machines and print the network interface report"""
     machines_meeting = []
     machines_not_meeting = []
 
-    # Process each machine
-    for machine in machines:
-        machine_name = machine.get(
-            "hostname", machine.get("fqdn", machine.get("system_id", "unknown"))
-        )
+    results = [process_machine(machine, summary_only) for machine in machines]
 
-        # Analyze machine interfaces
-        interface_data = analyze_interfaces(machine)
+    # Collect machine details in MAAS order and categorize machines
+    output = [f"Number of machines returned: {len(results)}\n"]
+    for name, meets_requirement, details in results:
+        output.append(details)
+        if meets_requirement:
+            machines_meeting.append(name)
+        else:
+            machines_not_meeting.append(name)
 
-        # Print machine details
-        print_machine_details(machine_name, interface_data)
+    output.append(format_summary(machines_meeting, machines_not_meeting, len(results)))
 
-        # Categorize machine
-        if interface_data["meets_requirement"]:
-            machines_meeting.append(machine_name)
-        else:
-            machines_not_meeting.append(machine_name)
+    # Write the whole report at once instead of line by line
+    sys.stdout.writelines(output)
+
+
+def main() -> None:
+    parser = build_parser("Query MAAS machines and show network interface information")
+    args = parser.parse_args()
 
-    # Print summary
-    print_summary(machines_meeting, machines_not_meeting, len(machines))
+    profile = load_maas_profile(args.profile)
+    run(get_machines(profile, args.tag, args.hostname), args.summary_only)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+
+import generate_disk_replacement_summary as disk_summary
+import generate_nic_summary as nic_summary
+from maas_common import build_parser, get_machines, load_maas_profile
+
+
+def main() -> None:
+    parser = build_parser(
+        "Query MAAS machines once and run both the disk and network interface audits"
+    )
+    args = parser.parse_args()
+
+    # Fetch the fleet once and share it between both audits
+    profile = load_maas_profile(args.profile)
+    machines = list(get_machines(profile, args.tag, args.hostname))
+
+    disk_summary.run(machines, args.summary_only)
+    nic_summary.run(machines, args.summary_only)
+
+
+if __name__ == "__main__":
+    main()
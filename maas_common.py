@@ -0,0 +1,299 @@
+"""Helpers shared by the hardware audit scripts for querying MAAS"""
+
+import argparse
+import contextlib
+import hashlib
+import itertools
+import os
+import json
+import sqlite3
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+try:
+    import ijson
+
+    json_errors = (ValueError, ijson.JSONError)
+except ImportError:
+    ijson = None
+    json_errors = (ValueError,)
+
+try:
+    import zstandard
+
+    cache_errors = (OSError, ValueError, zstandard.ZstdError)
+except ImportError:
+    zstandard = None
+    cache_errors = (OSError, ValueError)
+
+# Upper bound on concurrent MAAS queries so the region controller is not overloaded
+MAX_CONCURRENT_QUERIES = 5
+
+# Fields used by the audits, everything else MAAS returns is dropped on receipt
+MACHINE_FIELDS = (
+    "hostname",
+    "fqdn",
+    "system_id",
+    "boot_disk",
+    "blockdevice_set",
+    "interface_set",
+)
+BLOCK_DEVICE_FIELDS = ("id", "size", "tags", "name")
+INTERFACE_FIELDS = ("name", "enabled", "link_speed", "interface_speed")
+
+# Seconds to wait for MAAS to accept the connection and to send each chunk of data
+REQUEST_TIMEOUT = 60
+
+# Profiles created by `maas login` (API URL and OAuth credentials), either by
+# the deb-packaged or the snap-packaged CLI; MAASCLI_DB overrides both
+MAASCLI_DBS = (
+    os.path.expanduser("~/.maascli.db"),
+    os.path.expanduser("~/snap/maas/current/.maascli.db"),
+)
+
+# MAAS responses are cached here and revalidated with their ETag on every run
+CACHE_DIR = os.path.expanduser("~/.cache/maas-hwaudit")
+CACHE_SUFFIX = ".json.zst" if zstandard is not None else ".json"
+
+# Shared HTTP session so that MAAS queries reuse pooled keep-alive connections
+session = requests.Session()
+for scheme in ("http://", "https://"):
+    session.mount(scheme, HTTPAdapter(pool_connections=8, pool_maxsize=8))
+
+
+class MAASAuth(requests.auth.AuthBase):
+    """Sign requests with OAuth 1.0 PLAINTEXT, as expected by the MAAS API"""
+
+    def __init__(self, consumer_key: str, token_key: str, token_secret: str) -> None:
+        self.consumer_key = consumer_key
+        self.token_key = token_key
+        self.token_secret = token_secret
+
+    def __call__(self, request: requests.PreparedRequest) -> requests.PreparedRequest:
+        params = {
+            "oauth_version": "1.0",
+            "oauth_signature_method": "PLAINTEXT",
+            "oauth_consumer_key": self.consumer_key,
+            "oauth_token": self.token_key,
+            "oauth_signature": f"&{self.token_secret}",
+            "oauth_nonce": uuid.uuid4().hex,
+            "oauth_timestamp": str(int(time.time())),
+        }
+        request.headers["Authorization"] = "OAuth " + ", ".join(
+            f'{key}="{quote(value, safe="")}"' for key, value in params.items()
+        )
+        return request
+
+
+def build_parser(description: str) -> argparse.ArgumentParser:
+    """Return an argument parser with the options shared by all audit scripts"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("profile", help="MAAS profile name (required)")
+    parser.add_argument(
+        "--tag", nargs="+", help="Filter by one or more tags (optional)"
+    )
+    parser.add_argument(
+        "--hostname", nargs="+", help="Filter by one or more hostnames (optional)"
+    )
+    parser.add_argument(
+        "--summary-only",
+        action="store_true",
+        help="Only print the summary, skip per-machine details (optional)",
+    )
+    return parser
+
+
+def machine_name(machine: Dict[str, Any]) -> str:
+    """Return the name a machine is reported under"""
+    return machine.get(
+        "hostname", machine.get("fqdn", machine.get("system_id", "unknown"))
+    )
+
+
+def select_fields(data: Dict[str, Any], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    """Return a copy of data restricted to the given fields"""
+    return {field: data[field] for field in fields if field in data}
+
+
+def trim_machine(machine: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop the machine fields that are not needed by the audits"""
+    machine = select_fields(machine, MACHINE_FIELDS)
+    if machine.get("boot_disk") is not None:
+        machine["boot_disk"] = select_fields(machine["boot_disk"], BLOCK_DEVICE_FIELDS)
+    if "blockdevice_set" in machine:
+        machine["blockdevice_set"] = [
+            select_fields(device, BLOCK_DEVICE_FIELDS)
+            for device in machine["blockdevice_set"]
+        ]
+    if "interface_set" in machine:
+        machine["interface_set"] = [
+            select_fields(interface, INTERFACE_FIELDS)
+            for interface in machine["interface_set"]
+        ]
+    return machine
+
+
+def load_maas_profile(name: str) -> Dict[str, Any]:
+    """Read a MAAS CLI profile from the maas CLI database"""
+    if "MAASCLI_DB" in os.environ:
+        paths = [os.environ["MAASCLI_DB"]]
+    else:
+        paths = [path for path in MAASCLI_DBS if os.path.exists(path)]
+        if not paths:
+            print(
+                f"No MAAS CLI profiles found in {' or '.join(MAASCLI_DBS)}",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+    for path in paths:
+        try:
+            db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            with contextlib.closing(db):
+                row = db.execute(
+                    "SELECT data FROM profiles WHERE name = ?", (name,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading MAAS profiles from {path}: {e}", file=sys.stderr)
+            sys.exit(1)
+
+        if row is not None:
+            return json.loads(row[0])
+
+    print(f"MAAS profile not found: {name}", file=sys.stderr)
+    sys.exit(1)
+
+
+def cache_path(url: str, params: Dict[str, str]) -> str:
+    """Return the cache file path for a MAAS query"""
+    key = json.dumps([url, sorted(params.items())]).encode()
+    return os.path.join(CACHE_DIR, hashlib.sha256(key).hexdigest() + CACHE_SUFFIX)
+
+
+def load_cached_response(path: str) -> Tuple[Optional[str], Optional[bytes]]:
+    """Return the ETag and body of a cached MAAS response, if there is one"""
+    try:
+        with open(path, "rb") as f:
+            etag, body = f.read().split(b"\n", 1)
+        if zstandard is not None:
+            body = zstandard.ZstdDecompressor().decompress(body)
+    except FileNotFoundError:
+        return None, None
+    except cache_errors as e:
+        print(f"Warning: ignoring unreadable cache {path}: {e}", file=sys.stderr)
+        return None, None
+
+    return etag.decode(), body
+
+
+def save_cached_response(path: str, etag: str, body: bytes) -> None:
+    """Store a MAAS response body together with its ETag"""
+    if zstandard is not None:
+        body = zstandard.ZstdCompressor().compress(body)
+
+    try:
+        os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(etag.encode() + b"\n" + body)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: could not cache MAAS response: {e}", file=sys.stderr)
+
+
+def get_maas_machines(
+    profile: Dict[str, Any], tag: Optional[str] = None, hostname: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """Query the MAAS API for machines and yield them one at a time as they are parsed"""
+    url = profile["url"].rstrip("/") + "/machines/"
+    credentials = profile.get("credentials")
+    auth = MAASAuth(*credentials) if credentials else None
+    params = {}
+
+    if tag:
+        params["tags"] = tag
+
+    if hostname:
+        params["hostname"] = hostname
+
+    cache_file = cache_path(url, params)
+    etag, cached_body = load_cached_response(cache_file)
+    headers = {"If-None-Match": etag} if etag else {}
+
+    try:
+        with session.get(
+            url,
+            params=params,
+            auth=auth,
+            headers=headers,
+            stream=True,
+            timeout=REQUEST_TIMEOUT,
+        ) as response:
+            response.raise_for_status()
+            if response.status_code == 304:
+                # Nothing changed in MAAS since the response was cached
+                machines = json_loads(cached_body)
+            elif "ETag" in response.headers:
+                # The whole body is needed for the cache, so it is not streamed
+                body = response.content
+                save_cached_response(cache_file, response.headers["ETag"], body)
+                machines = json_loads(body)
+            elif ijson is not None:
+                # Stream machines off the socket instead of buffering the response
+                response.raw.decode_content = True
+                machines = ijson.items(response.raw, "item", use_float=True)
+            else:
+                machines = json_loads(response.content)
+            yield from map(trim_machine, machines)
+    except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+        # Errors while streaming response.raw come straight from urllib3
+        print(f"Error querying MAAS API: {e}", file=sys.stderr)
+        sys.exit(1)
+    except json_errors as e:
+        print(f"Error parsing JSON output: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def get_machines(
+    profile: Dict[str, Any],
+    tags: Optional[List[str]] = None,
+    hostnames: Optional[List[str]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Query MAAS once per tag/hostname combination and yield each machine once"""
+    queries = list(itertools.product(tags or [None], hostnames or [None]))
+
+    if len(queries) == 1:
+        # A single query can be streamed directly
+        results = [get_maas_machines(profile, *queries[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_QUERIES) as executor:
+            results = list(
+                executor.map(
+                    lambda query: list(get_maas_machines(profile, *query)), queries
+                )
+            )
+
+    # A machine may match several queries, only report it once
+    seen = set()
+    for machine in itertools.chain.from_iterable(results):
+        system_id = machine.get("system_id")
+        if system_id is not None:
+            if system_id in seen:
+                continue
+            seen.add(system_id)
+        yield machine